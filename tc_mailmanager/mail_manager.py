@@ -1,77 +1,319 @@
 import base64
+import binascii
+import copy
 import logging
+import mimetypes
 import os
-from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union, cast
-
-from envelopes import Envelope
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import (
-    Attachment,
-    Category,
-    Content,
-    Email,
-    Mail,
-    Personalization,
+import queue
+import re
+import smtplib
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
 )
+from email import policy as email_policy
+from email.message import EmailMessage, MIMEPart
+from email.utils import formataddr, mktime_tz, parsedate_tz
+from functools import lru_cache, partial
+from itertools import islice
+from types import MappingProxyType
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
+
+import orjson
 
 if TYPE_CHECKING:
+    import httpx
+    import requests
     from python_http_client.client import Response
 
+# Maximum numbers of personalizations, and of recipients over all of them, accepted by
+# SendGrid in a single request
+SENDGRID_MAX_PERSONALIZATIONS = 1000
+SENDGRID_MAX_RECIPIENTS = 1000
+# Size of the pool of keep-alive connections to the sendgrid API, which should be at least
+# the number of concurrent senders (see MailManager.max_workers)
+SENDGRID_POOL_SIZE = 50
+# Number of times a sendgrid request is retried when the API is unavailable or rate limiting,
+# with an exponential backoff, or after the delay given by its Retry-After header
+SENDGRID_MAX_RETRIES = 3
+# Statuses telling that a message has not been processed, so that it can be sent again
+SENDGRID_RETRY_STATUSES = (429, 503)
+# Longest delay waited before a retry, whatever the Retry-After header asks for (in seconds)
+SENDGRID_MAX_RETRY_AFTER = 30.0
+_SENDGRID_BACKOFF_FACTOR = 0.3
+
+_BASE64_LINE = re.compile(".{1,76}")
+# Files are encoded by chunks of a multiple of 57 bytes (one 76 characters line), so that
+# they need no padding and can be folded as they are encoded
+_BASE64_LINE_SIZE = 57
+_BASE64_READ_SIZE = _BASE64_LINE_SIZE * 2**12
+# CRLF line endings, and no 8bit content as not all SMTP servers support 8BITMIME
+_SMTP_POLICY = email_policy.SMTP.clone(cte_type="7bit")
+# Default values of the email attributes, shared by all the emails (hence immutable)
+_EMAIL_DEFAULTS: Dict[str, Any] = {
+    "Subject": "",
+    "Html-part": "",
+    "Attachments": (),
+    "Recipients": (),
+}
+# Number of distinct attachments kept encoded during a send (e.g. a report sent to many people)
+ATTACHMENTS_CACHE_SIZE = 32
+# Number of distinct html bodies kept encoded during a send (e.g. a newsletter sent to many
+# people; transactional emails rarely share theirs)
+BODIES_CACHE_SIZE = 8
+
+
+def _attachment_content(att_dict: Dict[str, Any]) -> Union[str, bytes]:
+    """Base64-encoded content of an attachment, given either as is or as a file path"""
+    if "path" in att_dict:
+        return _read_base64(att_dict["path"])
+    return cast(Union[str, bytes], att_dict["content"])
+
+
+def _base64_size(size: int, fold: bool) -> int:
+    if not fold:
+        return 4 * ((size + 2) // 3)
+    lines, rest = divmod(size, _BASE64_LINE_SIZE)
+    # each line ends with a newline
+    return lines * 77 + (4 * ((rest + 2) // 3) + 1 if rest else 0)
+
+
+def _read_base64(path: str, fold: bool = False) -> str:
+    """Base64-encodes a file chunk by chunk, so that its raw content is never fully loaded
+
+    With `fold`, it is encoded into lines of 76 characters (RFC 2045) as it goes.
+    """
+    encode: Callable[[bytes], bytes] = base64.encodebytes
+    if not fold:
+        encode = partial(binascii.b2a_base64, newline=False)
+    encoded = bytearray(_base64_size(os.path.getsize(path), fold))
+    with memoryview(encoded) as view, open(path, "rb") as f:
+        start = 0
+        for chunk in iter(partial(f.read, _BASE64_READ_SIZE), b""):
+            encoded_chunk = encode(chunk)
+            end = start + len(encoded_chunk)
+            view[start:end] = encoded_chunk
+            start = end
+    if fold:
+        del encoded[-1:]  # no newline after the last line (in place)
+    return encoded.decode("ascii")
+
+
+@lru_cache(maxsize=4)
+def _sendgrid_session(max_retries: int) -> "requests.Session":
+    """Keep-alive session shared by the sendgrid providers with as many retries, built on use"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    class CappedRetry(Retry):
+        def get_retry_after(self, response: Any) -> Optional[float]:
+            retry_after = super().get_retry_after(response)
+            return None if retry_after is None else min(retry_after, SENDGRID_MAX_RETRY_AFTER)
+
+    retry = CappedRetry(
+        total=max_retries,
+        read=0,  # the message may have been accepted already
+        backoff_factor=_SENDGRID_BACKOFF_FACTOR,
+        status_forcelist=SENDGRID_RETRY_STATUSES,
+        allowed_methods=None,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    session = requests.Session()
+    session.mount(
+        "https://",
+        HTTPAdapter(pool_maxsize=SENDGRID_POOL_SIZE, max_retries=retry),
+    )
+    return session
+
 
 class SendGridV3Provider:
     """Sendgrid (v3) specific code is here."""
 
-    def __init__(self, api_key: str) -> None:
+    def __init__(self, api_key: str, max_retries: int = SENDGRID_MAX_RETRIES) -> None:
+        # imported here, so that SMTP users don't pay for importing the sendgrid stack
+        from sendgrid import SendGridAPIClient
+
         self.sg = SendGridAPIClient(api_key=api_key)
+        self.max_retries = max_retries
+        # python_http_client opens a new connection for each request: emails are sent through
+        # a keep-alive session instead, shared by all the providers, so that successive sends
+        # reuse the same sockets
+        self._session = _sendgrid_session(max_retries)
+        self.timeout = 30.0
         self.logger = logging.getLogger(__name__)
+        self._headers = {**self.sg._default_headers, "Content-Type": "application/json"}
 
     @staticmethod
     def add_attachments(
-        mail: Mail, attachments: Union[List[Dict[str, Any]], Dict[str, Any]]
-    ) -> Mail:
+        message: Dict[str, Any],
+        attachments: Union[Dict[str, Any], Iterable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
         if isinstance(attachments, dict):
             attachments = [attachments]
-        for att_dict in attachments:
-            attachment = Attachment()
-            attachment.content = att_dict["content"]
-            attachment.filename = att_dict["filename"]
-            attachment.type = att_dict.get("type")
-            attachment.disposition = att_dict.get("disposition")
-            mail.add_attachment(attachment)
-        return mail
+        message["attachments"] = [
+            _sendgrid_attachment(
+                _attachment_content(att_dict),
+                att_dict["filename"],
+                att_dict.get("type"),
+                att_dict.get("disposition"),
+            )
+            for att_dict in attachments
+        ]
+        return message
 
     def create_message(self, email_attributes: Dict[str, Any]) -> Any:
-        mail = Mail()
-        mail.from_email = Email(email_attributes["FromEmail"], email_attributes["FromName"])
-        mail.subject = email_attributes["Subject"]
-        p = Personalization()
-        for recipient in email_attributes["Recipients"]:
-            p.add_to(Email(recipient["Email"], recipient.get("Name")))
-        mail.add_personalization(p)
-        for category in email_attributes.get("categories", []):
-            mail.add_category(Category(category))
-        # mail.add_content(Content("text/plain", "some text here"))
-        mail.add_content(Content("text/html", email_attributes["Html-part"]))
-        if email_attributes["Attachments"]:
-            mail = self.add_attachments(mail, email_attributes["Attachments"])
-        return mail.get()
-
-    def send_message(self, message: Dict[str, Any]) -> "Response":
-        pers = message["personalizations"][0]["to"]
-        dest = [d["email"] for d in pers]
-        self.logger.info(
-            f"[sendgrid] sending email to {dest}, with categories {message.get('categories', [])}"
+        message = self._create_base_message(email_attributes)
+        message["personalizations"] = [self._create_personalization(email_attributes)]
+        return message
+
+    def create_messages(self, emails_attributes: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Builds as few messages as possible to send all the emails
+
+        Emails sharing the same sender, subject, content, attachments and categories
+        are merged in a single message, with one personalization per email.
+        """
+        batches: Dict[Hashable, List[Dict[str, Any]]] = {}
+        for email_attributes in emails_attributes:
+            batches.setdefault(self._batch_key(email_attributes), []).append(email_attributes)
+
+        messages = []
+        for batch in batches.values():
+            # everything but the personalizations is serialized once for the whole batch
+            base_message = self._create_base_message(batch[0])
+            personalizations: List[Dict[str, Any]] = []
+            recipients_count = 0
+            for email_attributes in batch:
+                personalization = self._create_personalization(email_attributes)
+                count = self._count_recipients(personalization)
+                if personalizations and (
+                    len(personalizations) == SENDGRID_MAX_PERSONALIZATIONS
+                    or recipients_count + count > SENDGRID_MAX_RECIPIENTS
+                ):
+                    messages.append(dict(base_message, personalizations=personalizations))
+                    personalizations, recipients_count = [], 0
+                personalizations.append(personalization)
+                recipients_count += count
+            messages.append(dict(base_message, personalizations=personalizations))
+        return messages
+
+    def create_template_messages(
+        self, template_attributes: Dict[str, Any], recipients: Iterable[Dict[str, Any]]
+    ) -> Iterator[Dict[str, Any]]:
+        """Builds the messages sending the template to each recipient, as a separate email
+
+        Recipients are consumed by chunks, as the messages are built.
+        """
+        base_message = self._create_base_message(template_attributes)
+        # the template copies (cc, bcc) are part of each recipient's personalization
+        base_personalization = self._create_personalization(
+            dict(template_attributes, Recipients=None)
+        )
+        # each personalization counts its recipient and the copies towards the recipients limit
+        recipients_per_personalization = 1 + self._count_recipients(base_personalization)
+        chunk_size = min(
+            SENDGRID_MAX_PERSONALIZATIONS,
+            max(1, SENDGRID_MAX_RECIPIENTS // recipients_per_personalization),
         )
+        recipients = iter(recipients)
+        while True:
+            chunk = list(islice(recipients, chunk_size))
+            if not chunk:
+                return
+            personalizations = [
+                dict(base_personalization, to=[_sendgrid_email(r["Email"], r.get("Name"))])
+                for r in chunk
+            ]
+            yield dict(base_message, personalizations=personalizations)
+
+    @staticmethod
+    def _batch_key(email_attributes: Dict[str, Any]) -> Tuple[Any, ...]:
+        """Everything but the recipients, which end up in the personalizations"""
+        return (
+            email_attributes["FromEmail"],
+            email_attributes["FromName"],
+            email_attributes["Subject"],
+            email_attributes["Html-part"],
+            tuple(tuple(sorted(att_dict.items())) for att_dict in email_attributes["Attachments"]),
+            tuple(email_attributes.get("categories", [])),
+        )
+
+    def _create_base_message(self, email_attributes: Dict[str, Any]) -> Dict[str, Any]:
+        """Serialized message without its personalizations
+
+        The request body is built directly, as the `Mail` helper object graph would only
+        be walked once to produce the very same dict.
+        """
+        message: Dict[str, Any] = {
+            "from": _sendgrid_email(email_attributes["FromEmail"], email_attributes["FromName"]),
+            "subject": email_attributes["Subject"],
+            # {"type": "text/plain", "value": "some text here"},
+            "content": [{"type": "text/html", "value": email_attributes["Html-part"]}],
+        }
+        if email_attributes["Attachments"]:
+            message = self.add_attachments(message, email_attributes["Attachments"])
+        if email_attributes.get("categories"):
+            message["categories"] = list(email_attributes["categories"])
+        return message
+
+    @staticmethod
+    def _create_personalization(email_attributes: Dict[str, Any]) -> Dict[str, Any]:
+        """Serialized personalization, without going through the `Personalization` helper"""
+        personalization = {}
+        for field, key in (("Recipients", "to"), ("Cc", "cc"), ("Bcc", "bcc")):
+            if email_attributes.get(field):
+                personalization[key] = [
+                    _sendgrid_email(recipient["Email"], recipient.get("Name"))
+                    for recipient in email_attributes[field]
+                ]
+        return personalization
+
+    @staticmethod
+    def _count_recipients(personalization: Dict[str, Any]) -> int:
+        # sendgrid's recipients limit counts the copies (cc, bcc) too
+        return sum(len(addresses) for addresses in personalization.values())
+
+    def send_message(self, message: Dict[str, Any]) -> Union["Response", bool]:
+        _log_sendgrid_message(self.logger, message)
         try:
-            response = self.sg.client.mail.send.post(request_body=message)
+            response = self._session.post(
+                f"{self.sg.host}/v3/mail/send",
+                data=orjson.dumps(message),
+                headers=self._headers,
+                timeout=self.timeout,
+            )
         except Exception:
             self.logger.error("SendGridV3Provider send_message failed", exc_info=True)
             return False
-        return response
+        # same responses as the ones of the sendgrid client (with their `body` and `to_dict`)
+        return _sendgrid_response(response)
 
-    def is_successful_response(self, response: "Response") -> bool:
+    def is_successful_response(self, response: Union["Response", bool]) -> bool:
         """Allows to know if a message has been sucessfully sent"""
-        return (response is not False) and (200 <= response.status_code <= 299)
+        return not isinstance(response, bool) and (200 <= response.status_code <= 299)
+
+    def close(self) -> None:
+        """Closes the kept-alive connections (they are reopened as needed by later sends)"""
+        self._session.close()
 
     def get_emails(self, email_address: str, limit: int) -> Any:
         try:
@@ -89,8 +331,329 @@ class SendGridV3Provider:
             raise e
 
 
+class _UrllibResponse:
+    """requests response, seen as the urllib ones wrapped by python_http_client"""
+
+    def __init__(self, response: "requests.Response") -> None:
+        self._response = response
+
+    def getcode(self) -> int:
+        return self._response.status_code
+
+    def read(self) -> bytes:
+        return self._response.content
+
+    def info(self) -> Any:
+        return self._response.headers
+
+
+def _sendgrid_response(response: "requests.Response") -> "Response":
+    from python_http_client.client import Response
+
+    return Response(_UrllibResponse(response))
+
+
+def _log_sendgrid_message(logger: logging.Logger, message: Dict[str, Any]) -> None:
+    # the recipients list is only built if it is going to be logged
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "[sendgrid] sending email to %s, with categories %s",
+            [d["email"] for pers in message["personalizations"] for d in pers["to"]],
+            message.get("categories", ()),
+        )
+
+
+@lru_cache(maxsize=8192)
+def _sendgrid_email(email: str, name: Optional[str]) -> Dict[str, str]:
+    # the same people are often emailed again and again: parse and serialize them once
+    # (the returned dicts are only read when serializing the messages, so they can be shared)
+    from sendgrid.helpers.mail import Email
+
+    return cast(Dict[str, str], Email(email, name).get())
+
+
+def _sendgrid_attachment(
+    content: Union[str, bytes], filename: str, mimetype: Optional[str], disposition: Optional[str]
+) -> Dict[str, Any]:
+    if isinstance(content, bytes):
+        content = content.decode("ascii")  # base64: JSON needs it as a string
+    attachment: Dict[str, Any] = {"content": content, "filename": filename}
+    if mimetype is not None:
+        attachment["type"] = mimetype
+    if disposition is not None:
+        attachment["disposition"] = disposition
+    return attachment
+
+
+def _retry_delay(retry_after: Optional[str], retries: int) -> float:
+    """Seconds to wait before retrying a request already retried `retries` times, the way
+    urllib3 does for the requests session: as asked by its Retry-After header (in seconds or
+    as an HTTP-date, up to SENDGRID_MAX_RETRY_AFTER), or else with an exponential backoff
+    (which does not wait before the first retry)"""
+    seconds = 0.0
+    if retry_after and retry_after.strip().isdigit():
+        seconds = float(retry_after)
+    elif retry_after and (date := parsedate_tz(retry_after)) is not None:
+        seconds = mktime_tz(date) - time.time()
+    if seconds > 0:
+        return min(seconds, SENDGRID_MAX_RETRY_AFTER)
+    return float(_SENDGRID_BACKOFF_FACTOR * 2**retries) if retries else 0.0
+
+
+class AsyncSendGridV3Provider:
+    """Asyncio flavour of the sendgrid (v3) message sending (requires the `async` extra)
+
+    Meant to be used as an async context manager, so that the underlying HTTP/2 connections
+    are shared by all the messages sent within the context.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        host: str = "https://api.sendgrid.com",
+        max_retries: int = SENDGRID_MAX_RETRIES,
+    ) -> None:
+        import httpx
+
+        self.host = host
+        self.max_retries = max_retries
+        self.timeout = 30.0
+        self.logger = logging.getLogger(__name__)
+        self._client = httpx.AsyncClient(
+            http2=True,
+            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=100),
+            timeout=self.timeout,
+        )
+
+    async def __aenter__(self) -> "AsyncSendGridV3Provider":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self._client.aclose()
+
+    async def send_message(self, message: Dict[str, Any]) -> Union["httpx.Response", bool]:
+        import asyncio
+
+        import httpx
+
+        _log_sendgrid_message(self.logger, message)
+        content = orjson.dumps(message)
+        # same retries as the requests session of SendGridV3Provider: connection errors, and
+        # SENDGRID_RETRY_STATUSES (but not read errors, the message may have been accepted)
+        retries = 0
+        while True:
+            retry_after = None
+            try:
+                response = await self._client.post(f"{self.host}/v3/mail/send", content=content)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if retries >= self.max_retries:
+                    self.logger.error("AsyncSendGridV3Provider send_message failed", exc_info=True)
+                    return False
+            except Exception:
+                self.logger.error("AsyncSendGridV3Provider send_message failed", exc_info=True)
+                return False
+            else:
+                if (
+                    response.status_code not in SENDGRID_RETRY_STATUSES
+                    or retries >= self.max_retries
+                ):
+                    return response
+                retry_after = response.headers.get("Retry-After")
+            await asyncio.sleep(_retry_delay(retry_after, retries))
+            retries += 1
+
+    def is_successful_response(self, response: Union["httpx.Response", bool]) -> bool:
+        """Allows to know if a message has been sucessfully sent"""
+        return not isinstance(response, bool) and (200 <= response.status_code <= 299)
+
+
+class SMTPConnectionPool:
+    """Thread-safe pool of authenticated SMTP connections
+
+    Connections are opened lazily (at most `size` of them) and kept alive between messages,
+    so that the connection, STARTTLS and AUTH handshakes are not paid for every email.
+    A connection is recycled after `max_messages_per_connection` messages, or when it has
+    been idle for more than `max_idle_time` seconds (servers drop idle clients after a while).
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        login: Optional[str] = None,
+        password: Optional[str] = None,
+        tls: bool = False,
+        smtps: bool = False,
+        timeout: float = 30.0,
+        size: int = 4,
+        max_messages_per_connection: int = 1000,
+        max_idle_time: float = 60.0,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.login = login
+        self.password = password
+        self.tls = tls
+        self.smtps = smtps
+        self.timeout = timeout
+        self.size = size
+        self.max_messages_per_connection = max_messages_per_connection
+        self.max_idle_time = max_idle_time
+
+        # Each slot holds either None (not connected) or a (connection, sent messages,
+        # last use) tuple. LIFO, so that the most recently used connections are reused first
+        self._slots: "queue.LifoQueue[Optional[Tuple[smtplib.SMTP, int, float]]]"
+        self._slots = queue.LifoQueue()
+        for _ in range(size):
+            self._slots.put(None)
+
+    def _connect(self) -> smtplib.SMTP:
+        conn: smtplib.SMTP
+        if self.smtps:
+            conn = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.tls:
+            conn.starttls()
+        if self.login:
+            conn.login(self.login, self.password or "")
+        return conn
+
+    @staticmethod
+    def _quit(conn: smtplib.SMTP) -> None:
+        try:
+            conn.quit()
+        except smtplib.SMTPException:
+            conn.close()
+
+    def sendmail(
+        self, from_addr: str, to_addrs: List[str], msg: Union[str, bytes]
+    ) -> Dict[str, Any]:
+        slot = self._slots.get()
+        try:
+            if slot is not None and time.monotonic() - slot[2] > self.max_idle_time:
+                self._quit(slot[0])
+                slot = None
+            if slot is None:
+                slot = (self._connect(), 0, time.monotonic())
+            conn, sent, _ = slot
+            try:
+                result = conn.sendmail(from_addr, to_addrs, msg)
+            except smtplib.SMTPServerDisconnected:
+                # the server may have dropped the connection anyway: reconnect once
+                slot = (self._connect(), 0, time.monotonic())
+                conn, sent, _ = slot
+                result = conn.sendmail(from_addr, to_addrs, msg)
+
+            if sent + 1 >= self.max_messages_per_connection:
+                self._quit(conn)
+                slot = None
+            else:
+                slot = (conn, sent + 1, time.monotonic())
+            return result
+        except Exception:
+            if slot is not None:
+                self._quit(slot[0])
+                slot = None
+            raise
+        finally:
+            self._slots.put(slot)
+
+    def close(self) -> None:
+        """Closes all the open connections (waits for the ones being used)"""
+        slots = [self._slots.get() for _ in range(self.size)]
+        for slot in slots:
+            if slot is not None:
+                self._quit(slot[0])
+            self._slots.put(None)
+
+
+def _fold_base64(content: Union[str, bytes]) -> str:
+    """Folds base64 content into lines of at most 76 characters (RFC 2045)"""
+    if isinstance(content, bytes):
+        content = content.decode("ascii")
+    return "\n".join(_BASE64_LINE.findall("".join(content.split())))
+
+
+def _html_part(html: str) -> MIMEPart:
+    """Encoded html body, to be copied into the messages (it is never mutated)
+
+    Choosing and applying the transfer encoding of a large body is what costs the most
+    when building a message: it is only done once for all the emails sharing the body.
+    """
+    part = MIMEPart(policy=_SMTP_POLICY)
+    part.set_content(html, subtype="html")
+    return part
+
+
+def _attachment_source(att_dict: Dict[str, Any]) -> Tuple[Any, ...]:
+    """Identifies the content of an attachment: files by their path, modification time and size
+    (so that they are not read to be looked up), and contents given as is by themselves"""
+    if "path" in att_dict:
+        stat = os.stat(att_dict["path"])
+        return ("path", att_dict["path"], stat.st_mtime_ns, stat.st_size)
+    return ("content", att_dict["content"])
+
+
+def _source_payload(source: Tuple[Any, ...]) -> str:
+    """Folded base64 content of an attachment, given its `_attachment_source`"""
+    kind, value = source[:2]
+    # files are folded as they are read, only the contents given as is need normalizing
+    return _read_base64(value, fold=True) if kind == "path" else _fold_base64(value)
+
+
+class _PartsCache:
+    """Encoded parts shared by the SMTP messages of a single send, dropped along with it
+
+    A newsletter body, or a report attached to many emails, is then only encoded once,
+    without being kept in memory once the emails are sent.
+    """
+
+    def __init__(self) -> None:
+        self.html_part = lru_cache(maxsize=BODIES_CACHE_SIZE)(_html_part)
+        self._payload = lru_cache(maxsize=ATTACHMENTS_CACHE_SIZE)(_source_payload)
+
+    def attachment_payload(self, att_dict: Dict[str, Any]) -> str:
+        return self._payload(_attachment_source(att_dict))
+
+
+def _base64_attachment_part(payload: str, filename: str, mimetype: Optional[str]) -> MIMEPart:
+    """Builds an attachment part out of already base64-encoded (and folded) content
+
+    EmailMessage.add_attachment only accepts raw data, which it encodes itself: decoding
+    the content only to have it encoded again would be a waste, so the part is built directly.
+    """
+    if not mimetype:
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    part = MIMEPart()
+    part["Content-Type"] = mimetype
+    part["Content-Transfer-Encoding"] = "base64"
+    part.add_header("Content-Disposition", "attachment", filename=os.path.basename(filename))
+    part.set_payload(payload)
+    return part
+
+
+@lru_cache(maxsize=1)
+def _smtp_env_creds() -> Mapping[str, Any]:
+    """SMTP credentials from the environment, parsed once per process
+
+    (call `_smtp_env_creds.cache_clear()` to take changes of the SMTP_* variables into account)
+    """
+    return MappingProxyType(
+        {
+            "host": os.environ["SMTP_HOST"],
+            "port": int(os.environ["SMTP_PORT"]),
+            "login": os.environ["SMTP_LOGIN"],
+            "password": os.environ["SMTP_PASSWORD"],
+            "tls": os.environ.get("SMTP_TLS", "").lower() == "true",
+            "smtps": os.environ.get("SMTP_SMTPS", "").lower() == "true",
+        }
+    )
+
+
 class SMTPProvider:
-    """SMTP-Provider specific code is here (this implementation uses Envelopes)"""
+    """SMTP-Provider specific code is here (this implementation uses the stdlib email package)"""
 
     def __init__(self, smtp_credentials: Dict[str, Any]) -> None:
         # Mandatory fields:
@@ -102,55 +665,103 @@ class SMTPProvider:
         # Optional fields:
         self.smtp_is_tls = smtp_credentials.get("tls", False)
         self.smtp_is_smtps = smtp_credentials.get("smtps", False)
+        self.smtp_pool_size = smtp_credentials.get("pool_size", 4)
 
         self.smtp_timeout = 30.0
         self.logger = logging.getLogger(__name__)
+        self.pool = SMTPConnectionPool(
+            host=self.smtp_host,
+            port=self.smtp_port,
+            login=self.smtp_login,
+            password=self.smtp_password,
+            tls=self.smtp_is_tls,
+            smtps=self.smtp_is_smtps,
+            timeout=self.smtp_timeout,
+            size=self.smtp_pool_size,
+        )
 
     @staticmethod
     def add_attachments(
-        message: Envelope, attachments: Union[List[Dict[str, Any]], Dict[str, Any]]
-    ) -> Envelope:
+        message: EmailMessage,
+        attachments: Union[Dict[str, Any], Iterable[Dict[str, Any]]],
+        parts: Optional[_PartsCache] = None,
+    ) -> EmailMessage:
         if isinstance(attachments, dict):
             attachments = [attachments]
+        parts = parts or _PartsCache()
+        message.make_mixed()
         for att_dict in attachments:
-            # unlike sendgrid, envelopes does b64encode itself:
-            content = base64.b64decode(att_dict["content"])
             # att_dict["disposition"] is not handled
-            message.add_attachment(
-                file_path=att_dict["filename"], data=content, mimetype=att_dict.get("type")
+            payload = parts.attachment_payload(att_dict)
+            message.attach(
+                _base64_attachment_part(payload, att_dict["filename"], att_dict.get("type"))
             )
         return message
 
-    def create_message(self, email_attributes: Dict[str, Any]) -> Envelope:
-        recipients = []
-        for recipient in email_attributes["Recipients"]:
-            if "Name" in recipient:
-                recipients.append((recipient["Email"], recipient["Name"]))
-            else:
-                recipients.append(recipient["Email"])
-
-        message = Envelope(
-            from_addr=(email_attributes["FromEmail"], email_attributes["FromName"]),
-            to_addr=recipients,
-            subject=email_attributes["Subject"],
-            html_body=email_attributes["Html-part"],
+    @staticmethod
+    def _format_addresses(recipients: Iterable[Dict[str, Any]]) -> str:
+        return ", ".join(
+            formataddr((name, recipient["Email"]))
+            if (name := recipient.get("Name"))
+            else recipient["Email"]
+            for recipient in recipients
         )
+
+    def create_message(
+        self, email_attributes: Dict[str, Any], parts: Optional[_PartsCache] = None
+    ) -> EmailMessage:
+        message = EmailMessage(policy=_SMTP_POLICY)
+        message["Subject"] = email_attributes["Subject"]
+        message["From"] = formataddr((email_attributes["FromName"], email_attributes["FromEmail"]))
+        message["To"] = self._format_addresses(email_attributes["Recipients"])
+        if email_attributes.get("Cc"):
+            message["Cc"] = self._format_addresses(email_attributes["Cc"])
+        if email_attributes.get("Bcc"):
+            message["Bcc"] = self._format_addresses(email_attributes["Bcc"])
+        parts = parts or _PartsCache()
+        body = parts.html_part(email_attributes["Html-part"])
+        for header, value in body.items():
+            message[header] = value
+        message["MIME-Version"] = "1.0"
+        message.set_payload(body.get_payload())
         if email_attributes["Attachments"]:
-            message = self.add_attachments(message, email_attributes["Attachments"])
+            message = self.add_attachments(message, email_attributes["Attachments"], parts)
         return message
 
-    def send_message(self, message: Envelope) -> bool:
-        dest = [(d[0] if isinstance(d, tuple) else d) for d in message.to_addr]
-        self.logger.info(f"[smtp] sending email to {dest}")
+    def create_messages(
+        self, emails_attributes: Iterable[Dict[str, Any]]
+    ) -> Iterator[EmailMessage]:
+        # lazily, so that each message can be sent as soon as it is built
+        parts = _PartsCache()
+        return (self.create_message(email_attr, parts) for email_attr in emails_attributes)
+
+    def create_template_messages(
+        self, template_attributes: Dict[str, Any], recipients: Iterable[Dict[str, Any]]
+    ) -> Iterator[EmailMessage]:
+        """Builds the messages sending the template to each recipient, as a separate email"""
+        parts = _PartsCache()
+        return (
+            self.create_message(dict(template_attributes, Recipients=[recipient]), parts)
+            for recipient in recipients
+        )
+
+    def send_message(self, message: EmailMessage) -> bool:
+        to_addrs = [
+            address.addr_spec
+            for field in ("To", "Cc", "Bcc")
+            if field in message
+            for address in message[field].addresses
+        ]
+        self.logger.info("[smtp] sending email to %s", to_addrs)
+        if "Bcc" in message:
+            # like smtplib's send_message: blind copies only appear in the SMTP envelope
+            message = copy.copy(message)
+            del message["Bcc"]
         try:
-            conn, send_result = message.send(
-                host=self.smtp_host,
-                port=self.smtp_port,
-                login=self.smtp_login,
-                password=self.smtp_password,
-                tls=self.smtp_is_tls,
-                smtps=self.smtp_is_smtps,
-                timeout=self.smtp_timeout,
+            self.pool.sendmail(
+                message["From"].addresses[0].addr_spec,
+                to_addrs,
+                message.as_bytes(),
             )
         except Exception:
             self.logger.error("SMTPProvider send_message failed", exc_info=True)
@@ -162,6 +773,10 @@ class SMTPProvider:
         """Allows to know if a message has been sucessfully sent"""
         return response  # it's already a boolean
 
+    def close(self) -> None:
+        """Closes the kept-alive connections"""
+        self.pool.close()
+
     def get_emails(self, email_address: str, limit: int) -> Any:
         raise NotImplementedError("SMTPProvider cannot get_emails")
 
@@ -174,8 +789,13 @@ class MailManager:
         credentials: Union[Dict[str, Any], str, None] = None,
         credentials_from_env: bool = False,
         provider: str = "sendgrid",
+        max_workers: int = 16,
     ):
         self.logger = logging.getLogger(__name__)
+        # number of messages sent concurrently by send_emails (for SMTP, at most the size
+        # of the connection pool)
+        self.max_workers = max_workers
+        self.invalidate_env_cache()
         self.provider: Union[SendGridV3Provider, SMTPProvider]
         if provider == "sendgrid":
             self.provider = self.build_sendgrid_provider(
@@ -188,6 +808,25 @@ class MailManager:
         else:
             raise NotImplementedError(f"unknown provider: {provider}")
 
+    def invalidate_env_cache(self) -> None:
+        """(Re)reads the TOUCAN_FROM_* environment variables
+
+        They are only read once for all the emails sent by this manager.
+        """
+        self._from_email = os.environ.get("TOUCAN_FROM_EMAIL") or "noreply@mail.toucantoco.com"
+        self._from_name = os.environ.get("TOUCAN_FROM_NAME") or "Toucan Toco"
+        self._from_overwrite = os.environ.get("TOUCAN_FROM_OVERWRITE") == "enable"
+
+    def __enter__(self) -> "MailManager":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Closes the connections kept alive by the provider between sends"""
+        self.provider.close()
+
     @staticmethod
     def build_sendgrid_provider(
         credentials: Optional[str], credentials_from_env: bool
@@ -202,69 +841,217 @@ class MailManager:
         credentials: Optional[Dict[str, Any]], credentials_from_env: bool
     ) -> SMTPProvider:
         if credentials_from_env:
-            credentials = {
-                "host": os.environ["SMTP_HOST"],
-                "port": int(os.environ["SMTP_PORT"]),
-                "login": os.environ["SMTP_LOGIN"],
-                "password": os.environ["SMTP_PASSWORD"],
-                "tls": os.environ.get("SMTP_TLS", "").lower() == "true",
-                "smtps": os.environ.get("SMTP_SMTPS", "").lower() == "true",
-            }
+            credentials = dict(_smtp_env_creds())
         assert credentials is not None
         return SMTPProvider(credentials)
 
     def send_email(self, email_attributes):
         return self.send_emails([email_attributes])[0]
 
-    def send_emails(self, emails_attributes: List[Dict[str, Any]]) -> Any:
-        emails = [self._setup_email_template(email_attrs) for email_attrs in emails_attributes]
-        for email in emails:
-            self._validate_email_template(email)
+    def send_emails(
+        self, emails_attributes: Iterable[Dict[str, Any]], fail_fast: bool = False
+    ) -> Any:
+        """Sends all the emails and returns the providers' responses
+
+        Providers may merge several emails in a single message (e.g. sendgrid personalizations),
+        so there is one response per message actually sent, not one per email.
+
+        All the messages are sent before raising a `SendEmailException` for the ones that
+        failed. With `fail_fast`, sending stops at the first failure instead: the exception
+        then holds the failed messages, and the responses of the ones that were sent.
+
+        All the emails are validated before any of them is sent, but the messages are then
+        built one by one, as they are sent (when the provider does not need to merge them).
+        If building a message fails once some of them have been sent, the `SendEmailException`
+        raised holds the responses of the ones sent, and is caused by the building error.
+        """
+        messages = self.provider.create_messages(self._prepare_emails(emails_attributes))
+        return self._send_messages(messages, fail_fast)
+
+    def send_emails_to_template(
+        self,
+        template_attributes: Dict[str, Any],
+        recipients: Iterable[Dict[str, Any]],
+        fail_fast: bool = False,
+    ) -> Any:
+        """Sends the template (an email without "Recipients") to each of the recipients
+
+        This is the same as sending one email per recipient with `send_emails`, except that
+        the template is only set up and validated once, and that no per-recipient copy of it
+        is needed: recipients (e.g. `{"Email": "...", "Name": "..."}`) can be streamed.
+        They are checked as they are consumed: an invalid one raises an
+        `InvalidEmailTemplateException`, wrapped in a `SendEmailException` if some messages
+        have already been sent.
+        """
+        template = self._setup_email_template(template_attributes)
+        self._validate_email_template(template, with_recipients=False)
+        messages = self.provider.create_template_messages(
+            template, self._validate_recipients(recipients)
+        )
+        return self._send_messages(messages, fail_fast)
+
+    def _send_messages(self, messages: Iterable[Any], fail_fast: bool) -> List[Any]:
+        send_message = cast(Callable[[Any], Any], self.provider.send_message)
+        responses: Dict[int, Any] = {}
+        failed: Dict[int, Any] = {}
+        pending: Dict["Future[Any]", Tuple[int, Any]] = {}
+        sent = 0
+        max_workers = self.max_workers
+        if isinstance(self.provider, SMTPProvider):
+            # more workers would only wait for a connection, holding their built messages
+            max_workers = min(max_workers, self.provider.pool.size)
+
+        def collect(future: "Future[Any]") -> None:
+            index, msg = pending.pop(future)
+            responses[index] = future.result()
+            if not self.provider.is_successful_response(responses[index]):
+                failed[index] = msg
+
+        messages = iter(messages)
+        build_error: Optional[Exception] = None
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while not (fail_fast and failed):
+                if len(pending) >= 2 * max_workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future)
+                    continue
+                try:
+                    # messages are only built as they are about to be sent
+                    msg = next(messages, None)
+                except Exception as e:
+                    build_error = e
+                    break
+                if msg is None:
+                    break
+                pending[executor.submit(send_message, msg)] = (sent, msg)
+                sent += 1
+            if not (fail_fast and failed):
+                for future in as_completed(list(pending)):
+                    collect(future)
+                    if fail_fast and failed:
+                        break
+            if fail_fast and failed:
+                # don't send the messages that are still pending
+                for future in pending:
+                    future.cancel()
+        # the messages that were being sent when cancelling went out anyway
+        for future in list(pending):
+            if not future.cancelled():
+                collect(future)
+        all_responses = [responses.get(i) for i in range(sent)]
+        if build_error is not None and sent:
+            # some messages went out before the failing one could be built: tell which
+            raise SendEmailException(
+                failed_indices=sorted(failed),
+                responses=all_responses,
+                failed_messages=[failed[i] for i in sorted(failed)],
+            ) from build_error
+        if build_error is not None:
+            raise build_error
+        if failed:
+            raise SendEmailException(
+                failed_indices=sorted(failed),
+                responses=all_responses,
+                failed_messages=[failed[i] for i in sorted(failed)],
+            )
+        return all_responses
+
+    async def send_emails_async(
+        self,
+        emails_attributes: List[Dict[str, Any]],
+        max_concurrency: int = 100,
+        fail_fast: bool = False,
+    ) -> Any:
+        """Same as `send_emails`, but the messages are sent from the running event loop, with
+        up to `max_concurrency` requests in flight (sendgrid only, requires the `async` extra)
+        """
+        import asyncio
 
-        messages = [self.provider.create_message(email) for email in emails]
-        responses = [self.provider.send_message(msg) for msg in messages]
-        total_success = all(self.provider.is_successful_response(resp) for resp in responses)
+        if not isinstance(self.provider, SendGridV3Provider):
+            raise NotImplementedError("send_emails_async is only available with sendgrid")
 
-        if not total_success:
-            raise SendEmailException
+        messages = self.provider.create_messages(self._prepare_emails(emails_attributes))
+        responses: List[Any] = [None] * len(messages)
+        failed: Dict[int, Any] = {}
+        semaphore = asyncio.Semaphore(max_concurrency)
+        stopped = asyncio.Event()
+        sg = self.provider.sg
+        async with AsyncSendGridV3Provider(sg.apikey, sg.host, self.provider.max_retries) as sender:
+
+            async def send(index: int, message: Dict[str, Any]) -> None:
+                async with semaphore:
+                    if stopped.is_set():
+                        return  # don't send the messages that are still pending
+                    responses[index] = await sender.send_message(message)
+                if not sender.is_successful_response(responses[index]):
+                    failed[index] = message
+                    if fail_fast:
+                        stopped.set()
+
+            # the messages being sent when stopping are awaited, and their responses kept
+            await asyncio.gather(*(send(i, msg) for i, msg in enumerate(messages)))
+        if failed:
+            raise SendEmailException(
+                failed_indices=sorted(failed),
+                responses=responses,
+                failed_messages=[failed[i] for i in sorted(failed)],
+            )
         return responses
 
     def get_emails(self, username: str, limit: int = 10) -> Any:
         return self.provider.get_emails(username, limit)
 
+    def _prepare_emails(self, emails_attributes: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        emails = [self._setup_email_template(email_attrs) for email_attrs in emails_attributes]
+        for email in emails:
+            self._validate_email_template(email)
+        return emails
+
     def _setup_email_template(self, email_attributes: Dict[str, Any]) -> Dict[str, Any]:
         """Setup some default values for email_attributes"""
-        from_email = os.environ.get("TOUCAN_FROM_EMAIL") or "noreply@mail.toucantoco.com"
-        from_name = os.environ.get("TOUCAN_FROM_NAME") or "Toucan Toco"
-
         if not email_attributes:
             raise InvalidEmailTemplateException("Missing values to setup email template")
 
-        if os.environ.get("TOUCAN_FROM_OVERWRITE") == "enable":
-            email_attributes["FromEmail"] = from_email
-            email_attributes["FromName"] = from_name
-
-        email = {
-            "FromEmail": from_email,
-            "FromName": from_name,
-            "Subject": "",
-            "Html-part": "",
-            "Attachments": {},
-            "Recipients": [],
-        }
+        if self._from_overwrite:
+            email_attributes["FromEmail"] = self._from_email
+            email_attributes["FromName"] = self._from_name
+
+        email = dict(_EMAIL_DEFAULTS, FromEmail=self._from_email, FromName=self._from_name)
         email.update(email_attributes)
+        # a single attachment may be given as is: the providers always get a sequence
+        attachments = email["Attachments"]
+        if isinstance(attachments, dict):
+            email["Attachments"] = [attachments]
+        elif not attachments:
+            email["Attachments"] = ()
         return email
 
-    def _validate_email_template(self, email_template: Dict[str, Any]) -> None:
-        self._validate_email_template_empty_value(
-            "Subject",
-            email_template["Subject"],
-        )
-        self._validate_email_template_empty_value("Html-part", email_template["Html-part"])
-        self._validate_email_template_recipients(email_template["Recipients"])
+    def _validate_email_template(
+        self, email_template: Dict[str, Any], with_recipients: bool = True
+    ) -> None:
+        # Same checks as the _validate_email_template_* methods, inlined as they run
+        # for every single email of a bulk send
+        subject, html_part = email_template["Subject"], email_template["Html-part"]
+        if not subject or subject.isspace():
+            raise InvalidEmailTemplateException('The "Subject" of email template is empty')
+        if not html_part or html_part.isspace():
+            raise InvalidEmailTemplateException('The "Html-part" of email template is empty')
+        if with_recipients and not email_template["Recipients"]:
+            raise InvalidEmailTemplateException(
+                "The email template should have at least one recipient"
+            )
+
+    @staticmethod
+    def _validate_recipients(recipients: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        # lazily, so that a chunk of recipients is checked before its message is built
+        for index, recipient in enumerate(recipients):
+            if not isinstance(recipient, Mapping) or not recipient.get("Email"):
+                raise InvalidEmailTemplateException(f'The recipient {index} has no "Email"')
+            yield recipient
 
     def _validate_email_template_empty_value(self, field_name: str, field_content: str) -> None:
-        if len(field_content) == 0 or field_content.isspace():
+        if not field_content or field_content.isspace():
             raise InvalidEmailTemplateException(f'The "{field_name}" of email template is empty')
 
     def _validate_email_template_recipients(self, recipients: List[str]) -> None:
@@ -279,7 +1066,24 @@ class InvalidEmailTemplateException(Exception):
 
 
 class SendEmailException(Exception):
-    """Raised when an email failed to be sent"""
+    """Raised when an email failed to be sent
+
+    `failed_indices` are the indices of the messages that failed, and `failed_messages` the
+    messages themselves, ready to be sent again (providers may merge several emails in a
+    single message). `responses` are the responses of all the messages built so far (None
+    for the messages that have not been sent).
+    """
+
+    def __init__(
+        self,
+        failed_indices: Optional[List[int]] = None,
+        responses: Optional[List[Any]] = None,
+        failed_messages: Optional[List[Any]] = None,
+    ) -> None:
+        super().__init__(f"failed to send messages {failed_indices}" if failed_indices else "")
+        self.failed_indices = failed_indices or []
+        self.responses = responses or []
+        self.failed_messages = failed_messages or []
 
 
 class GetEmailException(Exception):
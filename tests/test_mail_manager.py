@@ -1,13 +1,37 @@
+import asyncio
+import base64
+import email
 import os
+import smtplib
+import time
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from typing import Any, Dict, Iterator
 
+import httpx
+import orjson
 import pytest
-from envelopes import Envelope
+import requests
+import urllib3
+from python_http_client.client import Response as SendGridResponse
+from requests.adapters import HTTPAdapter
 
-from tc_mailmanager import InvalidEmailTemplateException, MailManager
-from tc_mailmanager.mail_manager import SendGridV3Provider, SMTPProvider
+from tc_mailmanager import (
+    InvalidEmailTemplateException,
+    MailManager,
+    SendEmailException,
+    mail_manager as mail_manager_module,
+)
+from tc_mailmanager.mail_manager import (
+    AsyncSendGridV3Provider,
+    SendGridV3Provider,
+    SMTPConnectionPool,
+    SMTPProvider,
+)
 
 Response = namedtuple("Response", ["status_code"])
+HTTPResponse = namedtuple("HTTPResponse", ["status_code", "headers"])
 
 
 @pytest.fixture(scope="module")
@@ -86,17 +110,423 @@ def test_sendgrid_provider_category(email_with_categories):
     assert msg["categories"] == ["my_instance", "my_small_app", "lala.mynotif"]
 
 
+def test_sendgrid_provider_create_messages(mail_manager, email_with_categories):
+    provider = SendGridV3Provider(api_key="foo")
+    other_subject = dict(email_with_categories, Subject="Another subject")
+    emails = [
+        mail_manager._setup_email_template(dict(email_with_categories)),
+        mail_manager._setup_email_template(other_subject),
+        mail_manager._setup_email_template(
+            dict(email_with_categories, Recipients=[{"Email": "test3@toucantoco.com"}])
+        ),
+    ]
+    msgs = provider.create_messages(emails)
+
+    assert len(msgs) == 2
+    assert [[d["email"] for d in pers["to"]] for pers in msgs[0]["personalizations"]] == [
+        ["test1@toucantoco.com", "test2@toucantoco.com"],
+        ["test3@toucantoco.com"],
+    ]
+    assert msgs[1]["subject"] == "Another subject"
+    assert len(msgs[1]["personalizations"]) == 1
+
+
+def test_sendgrid_provider_create_messages_chunks(mail_manager, email_with_attachments):
+    provider = SendGridV3Provider(api_key="foo")
+    email = mail_manager._setup_email_template(email_with_attachments)
+    msgs = provider.create_messages([email] * 1001)
+
+    # no more than 1000 recipients per request: 500 emails of 2 recipients
+    assert [len(msg["personalizations"]) for msg in msgs] == [500, 500, 1]
+    assert msgs[0]["attachments"] == msgs[2]["attachments"]
+
+    # no more than 1000 personalizations per request
+    email["Recipients"] = email["Recipients"][:1]
+    msgs = provider.create_messages([email] * 1001)
+    assert [len(msg["personalizations"]) for msg in msgs] == [1000, 1]
+
+
+def test_sendgrid_provider_create_messages_newsletter(mail_manager, email_with_attachments):
+    provider = SendGridV3Provider(api_key="foo")
+    other = mail_manager._setup_email_template(dict(email_with_attachments, Subject="Other"))
+    emails = [
+        mail_manager._setup_email_template(
+            dict(email_with_attachments, Recipients=[{"Email": f"test{i}@toucantoco.com"}])
+        )
+        for i in range(2500)
+    ]
+    msgs = provider.create_messages(emails[:1200] + [other] + emails[1200:])
+
+    assert [len(msg["personalizations"]) for msg in msgs] == [1000, 1000, 500, 1]
+    # the body and attachments are built once, and shared by all the requests of a batch
+    assert msgs[0]["content"] is msgs[1]["content"] is msgs[2]["content"]
+    assert msgs[0]["attachments"] is msgs[2]["attachments"]
+    assert msgs[2]["personalizations"][-1]["to"] == [{"email": "test2499@toucantoco.com"}]
+
+
+def test_cc_bcc(mocker, mail_manager, email_with_categories):
+    email_with_categories["Cc"] = [{"Email": "cc@toucantoco.com", "Name": "Cc"}]
+    email_with_categories["Bcc"] = [{"Email": "bcc@toucantoco.com"}]
+    attributes = mail_manager._setup_email_template(email_with_categories)
+
+    msg = SendGridV3Provider(api_key="foo").create_message(attributes)
+    assert msg["personalizations"][0]["cc"] == [{"email": "cc@toucantoco.com", "name": "Cc"}]
+    assert msg["personalizations"][0]["bcc"] == [{"email": "bcc@toucantoco.com"}]
+    # 2 recipients, 1 cc and 1 bcc: at most 250 emails per request
+    msgs = SendGridV3Provider(api_key="foo").create_messages([attributes] * 1000)
+    assert [len(msg["personalizations"]) for msg in msgs] == [250] * 4
+
+    smtp = mocker.patch("smtplib.SMTP")
+    provider = SMTPProvider(
+        smtp_credentials={"host": "localhost", "port": 25, "login": "", "password": ""}
+    )
+    assert provider.send_message(provider.create_message(attributes))
+    _, to_addrs, sent = smtp.return_value.sendmail.call_args[0]
+    assert to_addrs[2:] == ["cc@toucantoco.com", "bcc@toucantoco.com"]
+    assert b"Cc: Cc <cc@toucantoco.com>" in sent
+    assert b"bcc@toucantoco.com" not in sent
+
+
+def requests_response(status_code: int, content: bytes = b"") -> requests.Response:
+    response = requests.Response()
+    response.status_code, response._content = status_code, content
+    return response
+
+
+def test_sendgrid_provider_send_message(mocker, email_with_categories):
+    provider = SendGridV3Provider(api_key="foo")
+    post = mocker.patch.object(provider._session, "post", return_value=requests_response(202))
+    msg = provider.create_message(email_with_categories)
+
+    response = provider.send_message(msg)
+    assert isinstance(response, SendGridResponse)
+    assert (response.status_code, response.body, response.to_dict) == (202, b"", None)
+    assert provider.is_successful_response(response)
+    post.assert_called_once_with(
+        "https://api.sendgrid.com/v3/mail/send",
+        data=orjson.dumps(msg),
+        headers=provider._headers,
+        timeout=provider.timeout,
+    )
+    assert provider._headers["Authorization"] == "Bearer foo"
+    # all the providers share the same keep-alive connections
+    assert SendGridV3Provider(api_key="bar")._session is provider._session
+
+    # responses are the same as the sendgrid client's ones
+    post.return_value = requests_response(400, b'{"errors": [{"message": "bad"}]}')
+    response = provider.send_message(msg)
+    assert response.to_dict == {"errors": [{"message": "bad"}]}
+    assert not provider.is_successful_response(response)
+
+
+def test_sendgrid_provider_retries():
+    adapter = SendGridV3Provider(api_key="foo")._session.get_adapter("https://")
+    assert isinstance(adapter, HTTPAdapter)
+    retry = adapter.max_retries
+    assert retry.total == 3
+    assert retry.is_retry("POST", 429, has_retry_after=True)
+    assert retry.is_retry("POST", 503)
+    assert not retry.is_retry("POST", 500)
+
+    # Retry-After delays are capped
+    too_long = urllib3.HTTPResponse(status=429, headers={"Retry-After": "3600"})
+    assert retry.get_retry_after(too_long) == mail_manager_module.SENDGRID_MAX_RETRY_AFTER
+
+    adapter = SendGridV3Provider(api_key="foo", max_retries=0)._session.get_adapter("https://")
+    assert isinstance(adapter, HTTPAdapter)
+    assert adapter.max_retries.total == 0
+
+
+def test_async_sendgrid_provider_retries(mocker, successful_response):
+    sleep = mocker.patch("asyncio.sleep", new_callable=mocker.AsyncMock)
+    post = mocker.patch("httpx.AsyncClient.post", new_callable=mocker.AsyncMock)
+    post.side_effect = [
+        httpx.ConnectError("refused"),
+        HTTPResponse(429, {"Retry-After": "3600"}),
+        HTTPResponse(503, {}),
+        HTTPResponse(503, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}),
+        successful_response,
+    ]
+    message = {"personalizations": [{"to": [{"email": "a@b.com"}]}]}
+
+    async def send(max_retries: int) -> Any:
+        async with AsyncSendGridV3Provider("foo", max_retries=max_retries) as sender:
+            return await sender.send_message(message)
+
+    assert asyncio.run(send(4)) == successful_response
+    # like urllib3: no backoff before the first retry, capped Retry-After delays, and the
+    # backoff used without them (or when their HTTP-date has passed)
+    assert [call[0][0] for call in sleep.call_args_list] == [0.0, 30.0, 1.2, 2.4]
+
+    post.side_effect = None
+    post.return_value = HTTPResponse(429, {})
+    post.reset_mock()
+    assert asyncio.run(send(1)) == HTTPResponse(429, {})
+    assert post.call_count == 2
+
+
+def test_sendgrid_provider_send_attachments(mocker, mail_manager, email_with_attachments):
+    provider = SendGridV3Provider(api_key="foo")
+    post = mocker.patch.object(provider._session, "post", return_value=requests_response(202))
+    msg = provider.create_message(mail_manager._setup_email_template(email_with_attachments))
+
+    # bytes contents are serialized as strings
+    assert provider.is_successful_response(provider.send_message(msg))
+    sent = orjson.loads(post.call_args[1]["data"])
+    assert [att["content"] for att in sent["attachments"]] == ["QA==", "QA=="]
+
+
+def test_attachments_from_path(tmp_path, mail_manager, email_with_attachments):
+    content = os.urandom(500_000)
+    path = tmp_path / "report.pdf"
+    path.write_bytes(content)
+    email_with_attachments["Attachments"] = {"filename": "report.pdf", "path": str(path)}
+    attributes = mail_manager._setup_email_template(email_with_attachments)
+
+    msg = SendGridV3Provider(api_key="foo").create_message(attributes)
+    assert base64.b64decode(msg["attachments"][0]["content"]) == content
+
+    provider = SMTPProvider(
+        smtp_credentials={"host": "localhost", "port": 25, "login": "", "password": ""}
+    )
+    parts = email.message_from_bytes(provider.create_message(attributes).as_bytes()).get_payload()
+    assert parts[1].get_content_type() == "application/pdf"
+    assert parts[1].get_payload(decode=True) == content
+
+    # files are folded as they are encoded, into the same lines as the contents given as is
+    for size in (0, 56, 57, 58, 500_000):
+        path.write_bytes(content[:size])
+        assert mail_manager_module._read_base64(str(path), fold=True) == (
+            mail_manager_module._fold_base64(base64.b64encode(content[:size]))
+        )
+
+
+def test_attachments_cache(mocker, mail_manager, email_with_attachments):
+    fold_base64 = mocker.spy(mail_manager_module, "_fold_base64")
+    email = mail_manager._setup_email_template(email_with_attachments)
+    smtp = SMTPProvider(
+        smtp_credentials={"host": "localhost", "port": 25, "login": "", "password": ""}
+    )
+
+    assert len(list(smtp.create_messages([email] * 3))) == 3
+    # both attachments share the same content: it is folded once for the whole send
+    assert fold_base64.call_count == 1
+    # ... and again for the next one, as nothing is kept in between
+    smtp.create_message(email)
+    assert fold_base64.call_count == 2
+
+
+def test_attachments_from_path_cache(mocker, tmp_path, mail_manager, email_with_attachments):
+    read_base64 = mocker.spy(mail_manager_module, "_read_base64")
+    path = tmp_path / "report.pdf"
+    path.write_bytes(b"v1")
+    email_with_attachments["Attachments"] = {"filename": "report.pdf", "path": str(path)}
+    attributes = mail_manager._setup_email_template(email_with_attachments)
+    smtp = SMTPProvider(
+        smtp_credentials={"host": "localhost", "port": 25, "login": "", "password": ""}
+    )
+
+    messages = smtp.create_messages([attributes] * 4)
+    next(messages), next(messages)
+    assert read_base64.call_count == 1
+    # the file has been changed in the meantime
+    path.write_bytes(b"new version")
+    parts = email.message_from_bytes(next(messages).as_bytes()).get_payload()
+    assert parts[1].get_payload(decode=True) == b"new version"
+    next(messages)
+    assert read_base64.call_count == 2
+
+
 def test_smtp_provider(mail_manager, email_with_attachments):
     provider = SMTPProvider(
         smtp_credentials={"host": "localhost", "port": 25, "login": "", "password": ""}
     )
     msg = provider.create_message(mail_manager._setup_email_template(email_with_attachments))
 
-    assert isinstance(msg, Envelope)
-    dest = [(d[0] if isinstance(d, tuple) else d) for d in msg.to_addr]
+    assert isinstance(msg, EmailMessage)
+    dest = [address.addr_spec for address in msg["To"].addresses]
     assert dest == ["test1@toucantoco.com", "test2@toucantoco.com"]
 
 
+def test_smtp_provider_attachments(mail_manager, email_with_attachments):
+    content = base64.b64encode(bytes(range(256)) * 2)
+    email_with_attachments["Attachments"] = {"filename": "data.bin", "content": content}
+    provider = SMTPProvider(
+        smtp_credentials={"host": "localhost", "port": 25, "login": "", "password": ""}
+    )
+    msg = provider.create_message(mail_manager._setup_email_template(email_with_attachments))
+    parts = email.message_from_bytes(msg.as_bytes()).get_payload()
+
+    assert len(parts) == 2
+    assert parts[1].get_content_type() == "application/octet-stream"
+    assert parts[1].get_filename() == "data.bin"
+    assert parts[1].get_payload(decode=True) == bytes(range(256)) * 2
+    assert max(len(line) for line in parts[1].get_payload().splitlines()) == 76
+
+    # the providers still accept a single attachment, without the template set up
+    assert len(provider.create_message(email_with_attachments).get_payload()) == 2
+    msg = SendGridV3Provider(api_key="foo").create_message(email_with_attachments)
+    assert [att["filename"] for att in msg["attachments"]] == ["data.bin"]
+
+
+def test_smtp_provider_shared_body(mocker, mail_manager):
+    provider = SMTPProvider(
+        smtp_credentials={"host": "localhost", "port": 25, "login": "", "password": ""}
+    )
+    html = "<p>Voilà votre rapport</p>" * 100
+    html_part = mocker.spy(mail_manager_module, "_html_part")
+    messages = list(
+        provider.create_messages(
+            mail_manager._setup_email_template(
+                {"Subject": "Report", "Html-part": html, "Recipients": [{"Email": f"{i}@a.com"}]}
+            )
+            for i in range(3)
+        )
+    )
+
+    # the body has been encoded once for all the messages
+    assert html_part.call_count == 1
+    for i, msg in enumerate(messages):
+        parsed = email.message_from_bytes(msg.as_bytes())
+        assert parsed["To"] == f"{i}@a.com"
+        assert parsed.get_content_type() == "text/html"
+        assert parsed.get_payload(decode=True).decode().rstrip() == html
+
+
+def test_smtp_provider_send_message(mocker, mail_manager, email_with_attachments):
+    smtp = mocker.patch("smtplib.SMTP")
+    provider = SMTPProvider(
+        smtp_credentials={"host": "localhost", "port": 25, "login": "foo", "password": "bar"}
+    )
+    msg = provider.create_message(mail_manager._setup_email_template(email_with_attachments))
+
+    assert provider.send_message(msg)
+    assert provider.send_message(msg)
+    smtp.assert_called_once_with("localhost", 25, timeout=30.0)
+    smtp.return_value.login.assert_called_once_with("foo", "bar")
+    assert smtp.return_value.sendmail.call_count == 2
+    from_addr, to_addrs, _ = smtp.return_value.sendmail.call_args[0]
+    assert from_addr == "noreply@toucantoco.com"
+    assert to_addrs == ["test1@toucantoco.com", "test2@toucantoco.com"]
+
+
+def test_smtp_connection_pool(mocker):
+    smtp = mocker.patch("smtplib.SMTP")
+    pool = SMTPConnectionPool("localhost", 25, max_messages_per_connection=2)
+
+    pool.sendmail("a@b.com", ["c@d.com"], "msg")
+    pool.sendmail("a@b.com", ["c@d.com"], "msg")
+    # the connection has been recycled after 2 messages
+    assert smtp.call_count == 1
+    smtp.return_value.quit.assert_called_once()
+
+    pool.sendmail("a@b.com", ["c@d.com"], "msg")
+    assert smtp.call_count == 2
+
+    # the server closed the connection in the meantime
+    smtp.return_value.sendmail.side_effect = [smtplib.SMTPServerDisconnected, {}]
+    pool.sendmail("a@b.com", ["c@d.com"], "msg")
+    assert smtp.call_count == 3
+
+    # the connection has been idle for too long
+    smtp.return_value.sendmail.side_effect = None
+    pool.max_idle_time = 0
+    pool.sendmail("a@b.com", ["c@d.com"], "msg")
+    assert smtp.call_count == 4
+
+    pool.close()
+    assert smtp.return_value.quit.call_count == 3
+
+
+def test_mail_manager_close(mocker):
+    smtp = mocker.patch("smtplib.SMTP")
+    credentials = {"host": "localhost", "port": 25, "login": "", "password": ""}
+    executor = mocker.patch.object(
+        mail_manager_module, "ThreadPoolExecutor", wraps=ThreadPoolExecutor
+    )
+    with MailManager(credentials, provider="smtp", max_workers=16) as mail_manager:
+        mail_manager.send_emails(
+            [
+                {
+                    "Subject": "Test email",
+                    "Html-part": "Test content",
+                    "Recipients": [{"Email": f"test{i}@toucantoco.com"}],
+                }
+                for i in range(8)
+            ]
+        )
+    assert smtp.return_value.sendmail.call_count == 8
+    # no more workers than connections in the pool
+    executor.assert_called_once_with(max_workers=4)
+    # all the connections opened by the pool have been closed
+    assert smtp.return_value.quit.call_count == smtp.call_count
+
+
+def test_send_emails_invalid(mocker):
+    smtp = mocker.patch("smtplib.SMTP")
+    credentials = {"host": "localhost", "port": 25, "login": "", "password": ""}
+    emails_attributes = (
+        {
+            "Subject": "Test email",
+            "Html-part": "Test content" if i < 3 else "",
+            "Recipients": [{"Email": f"test{i}@toucantoco.com"}],
+        }
+        for i in range(5)
+    )
+    with MailManager(credentials, provider="smtp") as mail_manager:
+        with pytest.raises(InvalidEmailTemplateException):
+            mail_manager.send_emails(emails_attributes)
+    # none of the emails has been sent
+    assert smtp.return_value.sendmail.call_count == 0
+
+
+def test_send_emails_build_error(mocker):
+    smtp = mocker.patch("smtplib.SMTP")
+    credentials = {"host": "localhost", "port": 25, "login": "", "password": ""}
+    emails_attributes = [
+        {
+            "Subject": "Test email" if i != 5 else "bad\nsubject",
+            "Html-part": "Test content",
+            "Recipients": [{"Email": f"test{i}@toucantoco.com"}],
+        }
+        for i in range(8)
+    ]
+    with MailManager(credentials, provider="smtp", max_workers=2) as mail_manager:
+        with pytest.raises(SendEmailException) as exc_info:
+            mail_manager.send_emails(emails_attributes)
+        # the 6th message could not be built, once the previous ones had been sent
+        assert isinstance(exc_info.value.__cause__, ValueError)
+        assert exc_info.value.responses == [True] * 5
+        assert smtp.return_value.sendmail.call_count == 5
+
+        # nothing has been sent yet: the error is raised as is
+        missing = {"filename": "report.pdf", "path": "/does/not/exist.pdf"}
+        with pytest.raises(FileNotFoundError):
+            mail_manager.send_emails([dict(emails_attributes[0], Attachments=missing)])
+
+
+def test_smtp_credentials_from_env(mocker):
+    mocker.patch.dict(
+        os.environ,
+        {
+            "SMTP_HOST": "localhost",
+            "SMTP_PORT": "25",
+            "SMTP_LOGIN": "foo",
+            "SMTP_PASSWORD": "bar",
+            "SMTP_TLS": "True",
+        },
+    )
+    mail_manager_module._smtp_env_creds.cache_clear()
+    provider = MailManager.build_smtp_provider(None, credentials_from_env=True)
+    assert (provider.smtp_host, provider.smtp_port) == ("localhost", 25)
+    assert (provider.smtp_login, provider.smtp_password) == ("foo", "bar")
+    assert provider.smtp_is_tls and not provider.smtp_is_smtps
+    # the environment is only parsed once
+    os.environ["SMTP_PORT"] = "587"
+    assert MailManager.build_smtp_provider(None, credentials_from_env=True).smtp_port == 25
+    mail_manager_module._smtp_env_creds.cache_clear()
+
+
 def test_send_email(mocker, mail_manager, successful_response):
     mocker.patch.object(mail_manager.provider, "send_message").return_value = successful_response
     email_attributes = {
@@ -109,6 +539,211 @@ def test_send_email(mocker, mail_manager, successful_response):
     assert resp == successful_response
 
 
+def test_send_emails(mocker, mail_manager):
+    send_message = mocker.patch.object(mail_manager.provider, "send_message")
+    send_message.side_effect = lambda msg: Response(200 + len(msg["personalizations"]))
+    emails_attributes = [
+        {
+            "Subject": f"Test email {i % 3}",
+            "Html-part": "Test content",
+            "Recipients": [{"Email": f"test{i}@toucantoco.com"}],
+        }
+        for i in range(9)
+    ]
+
+    resp = mail_manager.send_emails(emails_attributes)
+    assert resp == [Response(203)] * 3
+    assert send_message.call_count == 3
+
+
+def test_send_emails_fail_fast(mocker):
+    mail_manager = MailManager("test", max_workers=1)
+
+    def fake_send_message(msg):
+        if msg["subject"] == "Test email 1":
+            return Response(500)
+        if msg["subject"] != "Test email 0":
+            time.sleep(0.1)  # leaves time to cancel the pending messages
+        return Response(202)
+
+    send_message = mocker.patch.object(
+        mail_manager.provider, "send_message", side_effect=fake_send_message
+    )
+    emails_attributes = [
+        {
+            "Subject": f"Test email {i}",
+            "Html-part": "Test content",
+            "Recipients": [{"Email": "test@toucantoco.com"}],
+        }
+        for i in range(10)
+    ]
+
+    with pytest.raises(SendEmailException) as exc_info:
+        mail_manager.send_emails(emails_attributes, fail_fast=True)
+    assert exc_info.value.failed_indices == [1]
+    assert exc_info.value.responses[:2] == [Response(202), Response(500)]
+    # the pending messages have not been sent
+    assert send_message.call_count <= 3
+
+
+def test_send_emails_fail_fast_running(mocker):
+    mail_manager = MailManager("test", max_workers=4)
+
+    def fake_send_message(msg):
+        if msg["subject"] == "Test email 0":
+            return Response(500)
+        time.sleep(0.1)  # still being sent when the first one fails
+        return Response(202)
+
+    mocker.patch.object(mail_manager.provider, "send_message", side_effect=fake_send_message)
+    emails_attributes = [
+        {
+            "Subject": f"Test email {i}",
+            "Html-part": "Test content",
+            "Recipients": [{"Email": "test@toucantoco.com"}],
+        }
+        for i in range(4)
+    ]
+
+    with pytest.raises(SendEmailException) as exc_info:
+        mail_manager.send_emails(emails_attributes, fail_fast=True)
+    # the messages that were being sent are not reported as unsent
+    assert exc_info.value.responses == [Response(500)] + [Response(202)] * 3
+    assert exc_info.value.failed_indices == [0]
+    assert [msg["subject"] for msg in exc_info.value.failed_messages] == ["Test email 0"]
+
+
+def test_send_emails_no_fail_fast(mocker, mail_manager):
+    send_message = mocker.patch.object(mail_manager.provider, "send_message")
+    send_message.side_effect = lambda msg: Response(500 if msg["subject"][-1] in "13" else 202)
+    emails_attributes = [
+        {
+            "Subject": f"Test email {i}",
+            "Html-part": "Test content",
+            "Recipients": [{"Email": "test@toucantoco.com"}],
+        }
+        for i in range(5)
+    ]
+
+    with pytest.raises(SendEmailException) as exc_info:
+        mail_manager.send_emails(emails_attributes)
+    # all the emails are attempted by default
+    assert send_message.call_count == 5
+    assert exc_info.value.failed_indices == [1, 3]
+    assert exc_info.value.responses == [Response(202), Response(500)] * 2 + [Response(202)]
+
+
+def test_send_emails_to_template(mocker, mail_manager, successful_response):
+    send_message = mocker.patch.object(
+        mail_manager.provider, "send_message", return_value=successful_response
+    )
+    template = {"Subject": "Newsletter", "Html-part": "News", "Bcc": [{"Email": "a@b.com"}]}
+    recipients = ({"Email": f"test{i}@toucantoco.com"} for i in range(2500))
+
+    resp = mail_manager.send_emails_to_template(template, recipients)
+    # the bcc counts towards the 1000 recipients per request
+    assert resp == [successful_response] * 5
+    messages = [call[0][0] for call in send_message.call_args_list]
+    assert [len(msg["personalizations"]) for msg in messages] == [500] * 5
+    assert messages[4]["personalizations"][-1] == {
+        "to": [{"email": "test2499@toucantoco.com"}],
+        "bcc": [{"email": "a@b.com"}],
+    }
+
+    with pytest.raises(InvalidEmailTemplateException):
+        mail_manager.send_emails_to_template({"Subject": "Newsletter"}, recipients)
+
+
+def test_send_emails_to_template_invalid_recipient(mocker, mail_manager, successful_response):
+    send_message = mocker.patch.object(
+        mail_manager.provider, "send_message", return_value=successful_response
+    )
+    template = {"Subject": "Newsletter", "Html-part": "News"}
+    recipients = [{"Email": f"test{i}@toucantoco.com"} for i in range(2500)]
+    recipients[2100] = {"email": "test2100@toucantoco.com"}
+
+    with pytest.raises(SendEmailException) as exc_info:
+        mail_manager.send_emails_to_template(template, recipients)
+    # the chunk holding the invalid recipient has not been sent
+    assert send_message.call_count == 2
+    assert exc_info.value.responses == [successful_response] * 2
+    assert isinstance(exc_info.value.__cause__, InvalidEmailTemplateException)
+
+    send_message.reset_mock()
+    with pytest.raises(InvalidEmailTemplateException):
+        mail_manager.send_emails_to_template(template, recipients[2000:])
+    assert send_message.call_count == 0
+
+
+def test_send_emails_to_template_smtp(mocker):
+    smtp = mocker.patch("smtplib.SMTP")
+    smtp.return_value.sendmail.side_effect = smtplib.SMTPRecipientsRefused({})
+    credentials = {"host": "localhost", "port": 25, "login": "", "password": ""}
+    template = {"Subject": "Newsletter", "Html-part": "News"}
+    consumed = []
+
+    def recipients() -> Iterator[Dict[str, str]]:
+        for i in range(100):
+            consumed.append(i)
+            yield {"Email": f"test{i}@toucantoco.com", "Name": f"Test {i}"}
+
+    with MailManager(credentials, provider="smtp", max_workers=2) as mail_manager:
+        with pytest.raises(SendEmailException) as exc_info:
+            mail_manager.send_emails_to_template(template, recipients(), fail_fast=True)
+    assert exc_info.value.failed_indices
+    # sending stopped before going through all the recipients
+    assert len(consumed) < 100
+    assert smtp.return_value.sendmail.call_args_list[0][0][1] == ["test0@toucantoco.com"]
+
+
+def test_send_emails_async(mocker, mail_manager, successful_response):
+    post = mocker.patch("httpx.AsyncClient.post", new_callable=mocker.AsyncMock)
+    post.return_value = successful_response
+    emails_attributes = [
+        {
+            "Subject": f"Test email {i}",
+            "Html-part": "Test content",
+            "Recipients": [{"Email": "test@toucantoco.com"}],
+        }
+        for i in range(3)
+    ]
+
+    resp = asyncio.run(mail_manager.send_emails_async(emails_attributes))
+    assert resp == [successful_response] * 3
+    assert post.call_args[0][0] == "https://api.sendgrid.com/v3/mail/send"
+
+    async def fake_post(url, content):
+        await asyncio.sleep(0.01)
+        return Response(500) if b"Test email 1" in content else successful_response
+
+    post.reset_mock()
+    post.side_effect = fake_post
+    emails_attributes = [dict(emails_attributes[0], Subject=f"Test email {i}") for i in range(10)]
+    with pytest.raises(SendEmailException) as exc_info:
+        asyncio.run(
+            mail_manager.send_emails_async(emails_attributes, max_concurrency=1, fail_fast=True)
+        )
+    assert exc_info.value.failed_indices == [1]
+    # the pending messages have not been sent
+    assert post.call_count == 2
+    assert exc_info.value.responses[2:] == [None] * 8
+
+    async def slow_post(url, content):
+        if b"Test email 0" in content:
+            await asyncio.sleep(0.01)
+            return Response(500)
+        await asyncio.sleep(0.05)  # still being sent when the first one fails
+        return successful_response
+
+    post.side_effect = slow_post
+    with pytest.raises(SendEmailException) as exc_info:
+        asyncio.run(
+            mail_manager.send_emails_async(emails_attributes[:4], max_concurrency=4, fail_fast=True)
+        )
+    assert exc_info.value.responses == [Response(500)] + [successful_response] * 3
+    assert [msg["subject"] for msg in exc_info.value.failed_messages] == ["Test email 0"]
+
+
 def test_validate_email_template_empty_value(mail_manager):
     field_name, field_content = "Subject", "Want some viagra ?"
     ret = mail_manager._validate_email_template_empty_value(field_name, field_content)
@@ -125,12 +760,33 @@ def test_validate_email_template_empty_value(mail_manager):
         mail_manager._validate_email_template_empty_value(field_name, field_content)
 
 
+@pytest.mark.parametrize(
+    "attributes",
+    [
+        {"Subject": " ", "Html-part": "Test content", "Recipients": [{"Email": "a@b.com"}]},
+        {"Subject": "Test email", "Html-part": "", "Recipients": [{"Email": "a@b.com"}]},
+        {"Subject": "Test email", "Html-part": "Test content", "Recipients": []},
+    ],
+)
+def test_validate_email_template(mail_manager, attributes):
+    with pytest.raises(InvalidEmailTemplateException):
+        mail_manager._validate_email_template(mail_manager._setup_email_template(attributes))
+
+
 def test_setup_email_template(mail_manager):
     ret = mail_manager._setup_email_template({"FromEmail": "a@b.com", "FromName": "a"})
     assert ret["FromEmail"] == "a@b.com"
     assert ret["FromName"] == "a"
+    assert ret["Attachments"] == ()
+    # the defaults shared by all the templates can't be mutated
+    assert ret["Recipients"] == ()
+
+    attachment = {"filename": "data.bin", "content": b"QA=="}
+    ret = mail_manager._setup_email_template({"Attachments": attachment})
+    assert ret["Attachments"] == [attachment]
 
     os.environ["TOUCAN_FROM_OVERWRITE"] = "enable"
+    mail_manager.invalidate_env_cache()
     ret = mail_manager._setup_email_template({"FromEmail": "a@b.com", "FromName": "a"})
     assert ret["FromEmail"] == "noreply@mail.toucantoco.com"
     assert ret["FromName"] == "Toucan Toco"